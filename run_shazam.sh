@@ -95,6 +95,7 @@ show_help() {
   echo "  setup       - Install dependencies and set up the environment"
   echo "  download    - Download and analyze audio from URL"
   echo "               Example: ./run_shazam.sh download https://soundcloud.com/user/track"
+  echo "               Several URLs are downloaded in parallel"
   echo "  scan        - Process all downloaded files"
   echo "  recognize   - Process a specific audio file"
   echo "               Example: ./run_shazam.sh recognize path/to/file.mp3"
@@ -113,7 +114,7 @@ case "$1" in
       echo "Usage: ./run_shazam.sh download <url>"
       exit 1
     fi
-    run_shazam download "$2"
+    run_shazam download "${@:2}"
     ;;
   "scan")
     run_shazam scan
@@ -130,7 +131,7 @@ case "$1" in
     show_help
     ;;
   http://*|https://*)
-    run_shazam download "$1"
+    run_shazam download "$@"
     ;;
   *)
     echo "Unknown command: $1"
@@ -1,24 +1,62 @@
+import io
 import os
 import re
 import sys
+import json
+import hashlib
+import wave
+import math
+import random
 import asyncio
-import tempfile
+import contextlib
+import subprocess
 from datetime import datetime
 import logging
 import argparse
+from typing import Callable
 from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urlunparse
 
-from pydub import AudioSegment
+import aiohttp
+from aiolimiter import AsyncLimiter
 from shazamio import Shazam
+from shazamio.interfaces.client import HTTPClientInterface
+from shazamio.utils import validate_json
 from yt_dlp import YoutubeDL
 
 # Duration of each segment in milliseconds (1 minute)
 SEGMENT_LENGTH = 60 * 1000
 
+# Only this much audio from the middle of each segment is sent to Shazam (in milliseconds)
+FINGERPRINT_OFFSET = 24 * 1000
+FINGERPRINT_LENGTH = 12 * 1000
+
+# Segments are decoded to mono PCM at this sample rate before fingerprinting
+SAMPLE_RATE = 16000
+
 # Directory for downloaded files
 DOWNLOADS_DIR = 'downloads'
 
+# Recognition results keyed by the SHA-256 of the audio file
+CACHE_FILE = os.path.join('recognised-lists', '.cache.json')
+
+# Number of segments recognized concurrently per file
+RECOGNITION_CONCURRENCY = 6
+
+# Number of files recognized concurrently by scan
+FILE_CONCURRENCY = 2
+
+# Number of URLs downloaded concurrently (YouTube throttles more aggressive clients)
+DOWNLOAD_CONCURRENCY = 4
+
+# Shazam allows roughly 20 recognition requests per minute
+SHAZAM_RATE_LIMIT = 20
+SHAZAM_RATE_PERIOD = 60
+
+# Used to turn download titles into safe output filenames
+_UNSAFE_CHARS = re.compile(r'[^\w\s\-\(\)]')
+_WHITESPACE = re.compile(r'\s+')
+
 ALLOWED_DOMAINS = {
     'youtube.com', 'www.youtube.com', 'm.youtube.com',
     'youtu.be',
@@ -41,6 +79,10 @@ def sanitize_url_for_log(url: str) -> str:
     parsed = urlparse(url)
     return urlunparse(parsed._replace(query='', fragment=''))
 
+def sanitize_title(title: str) -> str:
+    """Strip unsafe characters from a title and replace whitespace with underscores."""
+    return _WHITESPACE.sub('_', _UNSAFE_CHARS.sub('', title).strip())
+
 # Logger setup 
 logger = logging.getLogger('shazam_tool')
 
@@ -87,7 +129,7 @@ def ensure_directory_exists(dir_path: str) -> None:
     Checks if directory exists, creates it if it doesn't.
     """
     os.makedirs(dir_path, exist_ok=True)
-    logger.debug(f"Ensured directory exists: {dir_path}")
+    logger.debug("Ensured directory exists: %s", dir_path)
 
 
 def remove_files(directory: str, extension: str = ".mp3") -> None:
@@ -98,7 +140,7 @@ def remove_files(directory: str, extension: str = ".mp3") -> None:
     for file_name in os.listdir(real_dir):
         file_path = os.path.join(real_dir, file_name)
         if not file_name.endswith(extension):
-            logger.debug(f"Skipping non-{extension} file: {file_name}")
+            logger.debug("Skipping non-%s file: %s", extension, file_name)
             continue
         if os.path.islink(file_path):
             logger.warning(f"Skipping symlink: {file_path}")
@@ -110,245 +152,515 @@ def remove_files(directory: str, extension: str = ".mp3") -> None:
             file_count += 1
         except OSError as e:
             logger.error(f"Error deleting file {file_path}: {e}")
-    logger.debug(f"Removed {file_count} files from {directory}")
+    logger.debug("Removed %d files from %s", file_count, directory)
 
 
-def write_to_file(data: str, filename: str) -> None:
+def list_mp3_files(directory: str = DOWNLOADS_DIR) -> list:
     """
-    Appends text string to specified file if data != 'Not found'.
+    Returns the MP3 files in `directory` as os.DirEntry objects.
+    scandir yields the file type with each entry, so no extra stat call is needed per file.
     """
-    if data != "Not found":
-        try:
-            with open(filename, "a", encoding="utf-8") as f:
-                f.write(f"{data}\n")
-        except OSError as e:
-            print(f"Error writing to file {filename}: {e}")
+    with os.scandir(directory) as it:
+        return [entry for entry in it if entry.name.endswith('.mp3') and entry.is_file()]
 
 
-def download_soundcloud(url: str, output_path: str = DOWNLOADS_DIR) -> str | None:
+def file_sha256(path: str) -> str:
     """
-    Download audio from a SoundCloud URL using yt-dlp.
-    Returns the track title on success, None on failure.
+    Returns the hex SHA-256 of a file.
+    hashlib.file_digest reads into one reusable buffer that OpenSSL hashes directly,
+    so the file is never fully loaded and no per-chunk bytes objects are created.
     """
-    ensure_directory_exists(output_path)
-    logger.debug(f"Attempting to download from SoundCloud: {sanitize_url_for_log(url)}")
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def load_cache(cache_file: str = CACHE_FILE) -> dict:
+    """Loads the {file hash: [tracks]} recognition cache, or an empty cache if unavailable."""
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': f'{output_path}/%(title)s.%(ext)s',
-            'restrictfilenames': True,
-        }
-
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'Unknown Title')
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable cache file {cache_file}: {e}")
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(cache: dict, cache_file: str = CACHE_FILE) -> None:
+    """Writes the recognition cache atomically so an interrupted run cannot corrupt it."""
+    tmp_file = f"{cache_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, cache_file)
+        logger.debug("Saved %d cached results to %s", len(cache), cache_file)
+    except OSError as e:
+        logger.error(f"Error saving cache file {cache_file}: {e}")
 
-        # Verify downloads landed in expected directory
-        real_output = os.path.realpath(output_path)
-        for f in os.listdir(output_path):
-            real_file = os.path.realpath(os.path.join(output_path, f))
-            if not real_file.startswith(real_output + os.sep):
-                logger.error(f"Security: file {f} resolved outside download directory, removing")
-                os.remove(os.path.join(output_path, f))
 
-        logger.info(f"Successfully downloaded from SoundCloud: {title}!")
-        return title
-    except Exception as e:
-        logger.error(f"Failed to download from SoundCloud {sanitize_url_for_log(url)}: {e}")
-        return None
+def download_hook(output_path: str,
+                  on_file_ready: Callable[[str], None] | None = None) -> Callable[[str], None]:
+    """
+    Returns a yt-dlp post hook that verifies each finished file landed inside `output_path`
+    (removing it otherwise) before passing its path on to `on_file_ready`.
+    Only files written by this download are checked, not the whole directory.
+    """
+    real_output = os.path.realpath(output_path)
+
+    def hook(file_path: str) -> None:
+        real_file = os.path.realpath(file_path)
+        if not real_file.startswith(real_output + os.sep):
+            logger.error(f"Security: file {os.path.basename(file_path)} resolved outside download directory, removing")
+            os.remove(file_path)
+            return
+        if on_file_ready:
+            on_file_ready(file_path)
 
+    return hook
 
-def download_youtube(url: str, output_path: str = DOWNLOADS_DIR) -> str | None:
+
+def _ydl_options(on_file_ready: Callable[[str], None] | None = None) -> dict:
+    """
+    Returns a fresh yt-dlp options dict for one download, shared by YouTube and SoundCloud.
+    yt-dlp modifies the dict it is given, so it must not be shared between downloads.
     """
-    Download the audio track from a YouTube video and convert to mp3 using yt-dlp.
-    Returns the video title on success, None on failure.
+    return {
+        'format': 'bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }],
+        'outtmpl': f'{DOWNLOADS_DIR}/%(title)s.%(ext)s',
+        'restrictfilenames': True,
+        'post_hooks': [download_hook(DOWNLOADS_DIR, on_file_ready)],
+    }
+
+
+def download_media(url: str, source_name: str,
+                   on_file_ready: Callable[[str], None] | None = None) -> str | None:
     """
-    ensure_directory_exists(output_path)
-    logger.debug(f"Attempting to download from YouTube: {sanitize_url_for_log(url)}")
+    Download the audio from a YouTube or SoundCloud URL and convert to mp3 using yt-dlp.
+    `on_file_ready` is called with the path of each finished, verified MP3.
+    Returns the title on success, None on failure.
+    """
+    ensure_directory_exists(DOWNLOADS_DIR)
+    logger.debug("Attempting to download from %s: %s", source_name, sanitize_url_for_log(url))
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': f'{output_path}/%(title)s.%(ext)s',
-            'restrictfilenames': True,
-        }
-
-        with YoutubeDL(ydl_opts) as ydl:
+        with YoutubeDL(_ydl_options(on_file_ready)) as ydl:
             info = ydl.extract_info(url, download=True)
-            title = info.get('title', 'Unknown Title')
-            logger.info(f"Successfully downloaded: {title}!")
-
-        # Verify downloads landed in expected directory
-        real_output = os.path.realpath(output_path)
-        for f in os.listdir(output_path):
-            real_file = os.path.realpath(os.path.join(output_path, f))
-            if not real_file.startswith(real_output + os.sep):
-                logger.error(f"Security: file {f} resolved outside download directory, removing")
-                os.remove(os.path.join(output_path, f))
+        title = info.get('title', 'Unknown Title')
 
+        logger.info(f"Successfully downloaded from {source_name}: {title}!")
         return title
-
     except Exception as e:
-        logger.error(f"Error downloading from YouTube {sanitize_url_for_log(url)}: {e}")
+        logger.error(f"Failed to download from {source_name} {sanitize_url_for_log(url)}: {e}")
         return None
 
 
-def download_from_url(url: str) -> str | None:
+def download_from_url(url: str, on_file_ready: Callable[[str], None] | None = None) -> str | None:
     """Determines if URL is YouTube or SoundCloud and calls appropriate download function.
     Returns the video/track title on success, None on failure."""
     logger.info("Starting download...")
     validate_url(url)
     safe_url = sanitize_url_for_log(url)
-    logger.debug(f"Processing URL: {safe_url}")
+    logger.debug("Processing URL: %s", safe_url)
     parsed = urlparse(url)
     hostname = parsed.hostname
     if 'soundcloud.com' in hostname:
         logger.info("SoundCloud URL detected")
-        return download_soundcloud(url)
+        return download_media(url, 'SoundCloud', on_file_ready)
     elif 'youtube.com' in hostname or hostname == 'youtu.be':
         logger.info("YouTube URL detected")
-        return download_youtube(url)
+        return download_media(url, 'YouTube', on_file_ready)
     else:
         logger.error("Unsupported URL format. Please provide a YouTube or SoundCloud link.")
         return None
 
 
-def segment_audio(audio_file: str, output_directory: str = "tmp", num_threads: int = 4) -> None:
+def download_many(urls: list, max_workers: int = DOWNLOAD_CONCURRENCY,
+                  on_file_ready: Callable[[str], None] | None = None) -> list:
+    """
+    Downloads several URLs in parallel threads; each download uses its own YoutubeDL instance.
+    Returns the titles in the same order as `urls` (None for failed downloads).
     """
-    Segments MP3 file into chunks of SEGMENT_LENGTH duration (in milliseconds)
-    using parallel processing.
+    if len(urls) == 1:
+        return [download_from_url(urls[0], on_file_ready)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda url: download_from_url(url, on_file_ready), urls))
+
+
+def probe_duration(audio_file: str) -> float | None:
     """
-    ensure_directory_exists(output_directory)
-    logger.debug(f"Segmenting audio file: {audio_file} with {num_threads} threads")
+    Returns the duration of the audio file in seconds using ffprobe, or None on failure.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        audio_file,
+    ]
     try:
-        audio = AudioSegment.from_file(audio_file, format="mp3")
-        segments = [audio[i:i + SEGMENT_LENGTH] for i in range(0, len(audio), SEGMENT_LENGTH)]
-        total_segments = len(segments)
-        logger.debug(f"Created {total_segments} segments of {SEGMENT_LENGTH}ms each")
-
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = []
-            for idx, seg in enumerate(segments, start=1):
-                segment_file_path = os.path.join(output_directory, f"{idx}.mp3")
-                futures.append(
-                    executor.submit(seg.export, segment_file_path, format="mp3")
-                )
-
-            for future in futures:
-                future.result()
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        duration = float(result.stdout.strip())
+        logger.debug("Duration of %s: %.1fs", audio_file, duration)
+        return duration
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logger.error(f"Failed to read duration of audio file {audio_file}: {e}")
+        return None
 
-    except Exception as e:
-        logger.error(f"Failed to segment audio file {audio_file}: {e}")
+
+async def extract_segment(audio_file: str, start: float, duration: float) -> bytes:
+    """
+    Extracts `duration` seconds of audio starting at `start` as a WAV block of
+    SAMPLE_RATE mono 16-bit PCM, the format Shazam fingerprints.
+    ffmpeg only decodes the requested window and streams it to stdout, so memory per
+    segment is fixed (~SAMPLE_RATE * 2 bytes * duration) regardless of the file length.
+    Several of these processes run in parallel, so each one is kept to a single thread
+    and detached from the terminal's stdin.
+    """
+    cmd = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-threads', '1',
+        '-ss', f"{start:.3f}", '-t', f"{duration:.3f}",
+        '-i', audio_file,
+        '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE),
+        '-f', 's16le', 'pipe:1',
+    ]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    pcm, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: "
+                           f"{err.decode(errors='replace').strip()}")
+
+    # ffmpeg can't seek back on a pipe to fill in WAV header sizes, so build the header here
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+
+class SessionHTTPClient(HTTPClientInterface):
+    """
+    shazamio HTTP client that sends every request through one shared aiohttp session,
+    so TLS connections are kept alive across segments instead of re-opened per request.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+
+    async def request(self, method: str, url: str, *args, **kwargs):
+        async with self.session.request(method, url, **kwargs) as resp:
+            # Surface HTTP errors (e.g. 429) with their status so get_name can back off
+            resp.raise_for_status()
+            return await validate_json(resp, *args)
 
 
-async def get_name(shazam: Shazam, file_path: str, max_retries: int = 3) -> str:
+@contextlib.asynccontextmanager
+async def open_shazam():
     """
-    Uses Shazam to recognize the song with retry logic and error handling.
-    Returns either 'Artist - Track Title' or 'Not found' if it fails.
+    Yields a Shazam client backed by a keep-alive aiohttp session, closed on exit.
+    trust_env is off so proxy settings aren't looked up from the environment on every request.
     """
-    logger.debug(f"Attempting to recognize: {file_path} (max retries: {max_retries})")
+    # One connection per segment worker that can be waiting on Shazam at once
+    max_connections = RECOGNITION_CONCURRENCY * FILE_CONCURRENCY
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_connections,
+                                     ttl_dns_cache=600, keepalive_timeout=120,
+                                     enable_cleanup_closed=True)
+    # sock_connect only covers the TCP connect, not time spent waiting for a free connection
+    timeout = aiohttp.ClientTimeout(total=15, sock_connect=3)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     trust_env=False) as session:
+        yield Shazam(http_client=SessionHTTPClient(session))
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """Returns True if the exception looks like a Shazam rate-limit/quota response."""
+    message = str(error).lower()
+    return '429' in message or 'rate' in message or 'quota' in message
+
+
+async def get_name(shazam: Shazam, audio: bytes, max_retries: int = 3,
+                   limiter: AsyncLimiter | None = None,
+                   backoff_base: float = 1, backoff_max: float = 30) -> str | None:
+    """
+    Uses Shazam to recognize the song in the given audio bytes with retry logic and error handling.
+    Rate-limit errors are retried with exponential backoff, other errors are retried
+    once immediately, and a response without track data is not retried at all.
+    Every attempt takes a token from `limiter` when one is given.
+    Returns 'Artist - Track Title', 'Not found' if Shazam has no match,
+    or None if every attempt failed with an error.
+    """
+    logger.debug("Attempting to recognize %d bytes of audio (max retries: %d)", len(audio), max_retries)
+    retried_error = False
     for attempt in range(max_retries):
         try:
-            logger.debug(f"Recognition attempt {attempt+1}/{max_retries}")
-            data = await shazam.recognize(file_path)
+            logger.debug("Recognition attempt %d/%d", attempt + 1, max_retries)
+            if limiter is not None:
+                async with limiter:
+                    data = await shazam.recognize(audio)
+            else:
+                data = await shazam.recognize(audio)
             if 'track' not in data:
-                logger.debug(f"No track data found in attempt {attempt+1}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2)
-                    continue
-                logger.debug("Recognition failed after all attempts")
+                logger.debug("No track data found in attempt %d", attempt + 1)
                 return "Not found"
 
             title = data['track']['title']
             subtitle = data['track']['subtitle']
             result = f"{subtitle} - {title}"
-            logger.debug(f"Recognition successful: {result}")
+            logger.debug("Recognition successful: %s", result)
             return result
 
         except Exception as e:
-            logger.debug(f"Error in recognition attempt {attempt+1}: {str(e)}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2)
+            logger.debug("Error in recognition attempt %d: %s", attempt + 1, e)
+            if attempt >= max_retries - 1:
+                break
+            if _is_rate_limited(e):
+                delay = min(backoff_max, backoff_base * 2 ** attempt + random.random())
+                logger.debug("Rate limited, backing off for %.1fs", delay)
+                await asyncio.sleep(delay)
+                continue
+            if not retried_error:
+                retried_error = True
                 continue
-            logger.debug("Recognition failed after all attempts due to exception")
-            return "Not found"
+            break
 
+    logger.debug("Recognition failed after all attempts due to exception")
+    return None
 
-async def _recognize_segments(tmp_dir: str, tmp_files: list, total_segments: int,
-                               output_filename: str, unique_tracks: list, seen_tracks: set) -> None:
-    shazam = Shazam()
-    for idx, file_name in enumerate(tmp_files, start=1):
-        segment_path = os.path.join(tmp_dir, file_name)
-        try:
-            track_name = await get_name(shazam, segment_path)
-            progress_str = f"[{idx}/{total_segments}]: {track_name}"
-            logger.info(progress_str)
-            if track_name != "Not found" and track_name not in seen_tracks:
-                seen_tracks.add(track_name)
-                unique_tracks.append(track_name)
-                write_to_file(track_name, output_filename)
-                logger.debug(f"Added new unique track: {track_name}")
-        except Exception as e:
-            logger.error(f"Error processing segment {file_name}: {e}")
-            continue
-        # Small delay between requests to avoid rate limiting
-        if idx < total_segments:
-            await asyncio.sleep(0.5)
 
+def fingerprint_window(idx: int, duration: float) -> tuple[float, float]:
+    """
+    Returns (start, length) in seconds of the snippet sent to Shazam for segment `idx` (1-based).
+    The snippet sits FINGERPRINT_OFFSET into the segment. If the rest of the file is too short
+    for that, it ends at the end of the file instead, reaching back into the previous segment
+    when the final segment is shorter than FINGERPRINT_LENGTH.
+    """
+    segment_start = (idx - 1) * SEGMENT_LENGTH
+    segment_length = min(SEGMENT_LENGTH, duration * 1000 - segment_start)
+    start = segment_start + min(FINGERPRINT_OFFSET, segment_length - FINGERPRINT_LENGTH)
+    return max(0, start) / 1000, FINGERPRINT_LENGTH / 1000
+
+
+def segment_count(duration: float) -> int:
+    """Returns the number of SEGMENT_LENGTH segments needed to cover `duration` seconds."""
+    return math.ceil(duration * 1000 / SEGMENT_LENGTH)
+
+
+def iter_segments(duration: float):
+    """
+    Lazily yields (idx, start, length) for each segment of a file lasting `duration` seconds,
+    so no per-segment state exists before a worker picks the segment up.
+    """
+    for idx in range(1, segment_count(duration) + 1):
+        yield (idx, *fingerprint_window(idx, duration))
+
+
+async def _recognize_segments(shazam: Shazam, limiter: AsyncLimiter, audio_file: str,
+                               duration: float, total_segments: int,
+                               concurrency: int = RECOGNITION_CONCURRENCY) -> tuple[list, bool]:
+    """
+    Extracts and recognizes segments with `concurrency` workers sharing one segment generator,
+    so at most `concurrency` segments are pending or held in memory, within Shazam's rate limit.
+    Results are collected per segment index so the tracklist keeps the mix order.
+    Returns the unique tracks found and whether every segment was processed without an error.
+    """
+    results = [None] * total_segments
+    segments = iter_segments(duration)
+    name = os.path.basename(audio_file)
+
+    async def _worker() -> None:
+        for idx, start, length in segments:
+            try:
+                data = await extract_segment(audio_file, start, length)
+                track_name = await get_name(shazam, data, limiter=limiter)
+                if track_name is None:
+                    logger.error("Error recognizing segment %d of %s: gave up after retries", idx, name)
+                    continue
+                logger.info("[%d/%d] %s: %s", idx, total_segments, name, track_name)
+                results[idx - 1] = track_name
+            except Exception as e:
+                logger.error("Error processing segment %d of %s: %s", idx, name, e)
 
-def process_audio_file(audio_file: str, output_filename: str, file_index: int, total_files: int) -> None:
+    await asyncio.gather(*[_worker() for _ in range(concurrency)])
+
+    unique_tracks = []
+    seen_tracks = set()
+    for track_name in results:
+        if track_name and track_name != "Not found" and track_name not in seen_tracks:
+            seen_tracks.add(track_name)
+            unique_tracks.append(track_name)
+            logger.debug("Added new unique track: %s", track_name)
+
+    return unique_tracks, all(track_name is not None for track_name in results)
+
+
+async def process_audio_file_async(audio_file: str, output_filename: str, file_index: int,
+                                   total_files: int, shazam: Shazam, limiter: AsyncLimiter,
+                                   cache: dict, write_lock: asyncio.Lock) -> None:
+    """
+    Recognizes one audio file and appends its tracklist to `output_filename`.
+    The file's section is written in one go under `write_lock`, so files processed
+    concurrently never interleave in the output.
+    """
     if total_files > 2:
         logger.info(f"\n[{file_index}/{total_files}] Processing file: {audio_file}")
     else:
         logger.info(f"\nProcessing file: {audio_file}")
 
-    logger.debug(f"Starting processing for {audio_file}")
-    unique_tracks = []
-    seen_tracks = set()
+    logger.debug("Starting processing for %s", audio_file)
     try:
-        with open(output_filename, "a", encoding="utf-8") as f:
-            f.write(f"===== {os.path.basename(audio_file)} ======\n")
-        logger.debug(f"Created file header for {audio_file}")
+        file_hash = await asyncio.to_thread(file_sha256, audio_file)
     except OSError as e:
-        logger.error(f"Error writing header for {audio_file}: {e}")
-        return
+        logger.error(f"Error hashing {audio_file}, skipping cache: {e}")
+        file_hash = None
 
-    with tempfile.TemporaryDirectory(prefix="shazam_") as tmp_dir:
-        logger.info("1/4 Segmenting audio file...")
-        segment_audio(audio_file, tmp_dir)
+    cacheable = False
+    if file_hash in cache:
+        logger.info("Found cached results, skipping recognition")
+        unique_tracks = cache[file_hash]
+    else:
+        logger.info(f"1/4 Segmenting {os.path.basename(audio_file)}...")
+        duration = await asyncio.to_thread(probe_duration, audio_file)
+        if duration is None:
+            logger.error(f"Skipping file {audio_file}: could not read its duration")
+            return
+        total_segments = segment_count(duration)
+        logger.debug("Found %d segments to process", total_segments)
 
-        logger.info("2/4 Recognizing segments...")
-        tmp_files = sorted(os.listdir(tmp_dir), key=lambda x: int(os.path.splitext(x)[0]))
-        total_segments = len(tmp_files)
-        logger.debug(f"Found {total_segments} segments to process")
+        logger.info(f"2/4 Recognizing segments of {os.path.basename(audio_file)}...")
+        unique_tracks, complete = await _recognize_segments(shazam, limiter, audio_file,
+                                                            duration, total_segments)
+        # Only cache clean runs (even with no matches), so transient failures are retried next time
+        cacheable = bool(file_hash and complete)
 
-        asyncio.run(_recognize_segments(tmp_dir, tmp_files, total_segments,
-                                         output_filename, unique_tracks, seen_tracks))
+    async with write_lock:
+        try:
+            with open(output_filename, "a", encoding="utf-8", buffering=1 << 16) as f:
+                f.write(f"===== {os.path.basename(audio_file)} ======\n")
+                for track_name in unique_tracks:
+                    f.write(f"{track_name}\n")
+                # Add an empty line after processing each file
+                f.write("\n")
+            logger.debug("Wrote %d tracks for %s", len(unique_tracks), audio_file)
+        except OSError as e:
+            logger.error(f"Error writing results for {audio_file}: {e}")
+            return
 
-    # Add an empty line after processing each file
-    try:
-        with open(output_filename, "a", encoding="utf-8") as f:
-            f.write("\n")
-    except OSError as e:
-        logger.error(f"Error writing empty line for {audio_file}: {e}")
+        if cacheable:
+            cache[file_hash] = unique_tracks
+            save_cache(cache)
 
-    if unique_tracks:
-        logger.info(f"\n--- Tracklist ({len(unique_tracks)} tracks) ---")
-        for i, track in enumerate(unique_tracks, 1):
-            logger.info(f"  {i}. {track}")
-        logger.info("---")
+        if unique_tracks:
+            logger.info(f"\n--- Tracklist for {os.path.basename(audio_file)} ({len(unique_tracks)} tracks) ---")
+            for i, track in enumerate(unique_tracks, 1):
+                logger.info(f"  {i}. {track}")
+            logger.info("---")
 
     logger.info(f"Successfully processed file: {audio_file}")
-    logger.debug(f"Found {len(unique_tracks)} unique tracks in {audio_file}")
+    logger.debug("Found %d unique tracks in %s", len(unique_tracks), audio_file)
+
+
+@contextlib.asynccontextmanager
+async def open_recognizer(output_filename: str):
+    """
+    Yields an async `recognize(audio_file, file_index, total_files)` callable.
+    All calls share one Shazam session, one rate limiter (so the 20 requests/minute
+    budget is global), the recognition cache and a lock on the output file.
+    """
+    async with open_shazam() as shazam:
+        limiter = AsyncLimiter(SHAZAM_RATE_LIMIT, SHAZAM_RATE_PERIOD)
+        cache = load_cache()
+        write_lock = asyncio.Lock()
+
+        async def recognize(audio_file: str, file_index: int, total_files: int) -> None:
+            try:
+                await process_audio_file_async(audio_file, output_filename, file_index, total_files,
+                                               shazam, limiter, cache, write_lock)
+            except Exception as e:
+                logger.error(f"Failed to process file {audio_file}: {e}")
+
+        yield recognize
+
+
+async def recognize_files(audio_files: list, output_filename: str,
+                          concurrency: int = FILE_CONCURRENCY) -> None:
+    """Recognizes `audio_files`, at most `concurrency` at a time, into `output_filename`."""
+    sem = asyncio.Semaphore(concurrency)
+    total_files = len(audio_files)
+
+    async with open_recognizer(output_filename) as recognize:
+        async def _one(idx: int, audio_file: str) -> None:
+            async with sem:
+                await recognize(audio_file, idx, total_files)
+
+        await asyncio.gather(*[_one(idx, f) for idx, f in enumerate(audio_files, start=1)])
+
+
+def process_audio_file(audio_file: str, output_filename: str) -> None:
+    """Recognizes a single audio file and appends its tracklist to `output_filename`."""
+    asyncio.run(recognize_files([audio_file], output_filename))
+
+
+async def download_and_process(urls: list, output_filename: str) -> tuple[list, list[str]]:
+    """
+    Downloads `urls` and recognizes each MP3 as soon as yt-dlp finishes it, so recognition
+    of one track overlaps the download of the next. Once the downloads are done, any other
+    MP3s in DOWNLOADS_DIR are queued too, so every file shares one recognizer and rate limit.
+    Returns the download titles (None for failures) and the paths that were processed.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    queued = set()
+
+    def enqueue(path: str) -> None:
+        real_path = os.path.realpath(path)
+        if real_path not in queued:
+            queued.add(real_path)
+            queue.put_nowait(path)
+
+    def on_file_ready(path: str) -> None:
+        # Called from the yt-dlp worker thread
+        loop.call_soon_threadsafe(enqueue, path)
+
+    async def _download() -> list:
+        try:
+            titles = await loop.run_in_executor(None, download_many, urls, DOWNLOAD_CONCURRENCY,
+                                                on_file_ready)
+            # Process any other downloaded files as well
+            ensure_directory_exists(DOWNLOADS_DIR)
+            others = [entry.path for entry in list_mp3_files(DOWNLOADS_DIR)
+                      if os.path.realpath(entry.path) not in queued]
+            if others:
+                logger.info(f"Found {len(others)} other MP3 file(s) to process...")
+            for path in others:
+                enqueue(path)
+            return titles
+        finally:
+            queue.put_nowait(None)
+
+    async def _recognize() -> list[str]:
+        processed = []
+        async with open_recognizer(output_filename) as recognize:
+            async def _worker() -> None:
+                while (path := await queue.get()) is not None:
+                    processed.append(path)
+                    logger.debug("Recognizing: %s", path)
+                    await recognize(path, len(processed), 1)
+                # Pass the end marker on to the next worker
+                queue.put_nowait(None)
+
+            await asyncio.gather(*[_worker() for _ in range(FILE_CONCURRENCY)])
+        return processed
+
+    titles, processed = await asyncio.gather(_download(), _recognize())
+    return titles, processed
 
 
 def process_downloads() -> None:
@@ -359,14 +671,14 @@ def process_downloads() -> None:
     ensure_directory_exists(output_dir)
     ensure_directory_exists(DOWNLOADS_DIR)
 
-    mp3_files = [f for f in os.listdir(DOWNLOADS_DIR) if f.endswith('.mp3')]
+    mp3_files = list_mp3_files(DOWNLOADS_DIR)
     if not mp3_files:
         logger.warning(f"No MP3 files found in '{DOWNLOADS_DIR}' directory.")
         return
 
     timestamp = datetime.now().strftime("%d%m%y-%H%M%S")
     output_filename = os.path.join(output_dir, f"songs-{timestamp}.txt")
-    logger.debug(f"Created output file: {output_filename}")
+    logger.debug("Created output file: %s", output_filename)
 
     try:
         with open(output_filename, "w", encoding="utf-8") as f:
@@ -379,10 +691,7 @@ def process_downloads() -> None:
     logger.info(f"Found {total_files} MP3 file(s) to process...")
     logger.info("Starting processing...")
 
-    for idx, file_name in enumerate(mp3_files, start=1):
-        full_path = os.path.join(DOWNLOADS_DIR, file_name)
-        logger.debug(f"Processing file {idx}/{total_files}: {full_path}")
-        process_audio_file(full_path, output_filename, idx, total_files)
+    asyncio.run(recognize_files([entry.path for entry in mp3_files], output_filename))
 
     logger.info(f"\nAll files successfully processed!")
     logger.info(f"Results saved to {output_filename}")
@@ -399,7 +708,7 @@ Usage: python shazam.py [command] [options]
 
 Commands:
     scan                       Scan downloads directory and recognize all MP3
-    download <url>             Download and process audio from YouTube or SoundCloud
+    download <url> [<url> ...] Download and process audio from YouTube or SoundCloud
     recognize <file_or_url>    Recognize specific audio file or download and recognize from URL
 
 Options:
@@ -410,6 +719,7 @@ Examples:
     python shazam.py scan --debug
     python shazam.py download https://www.youtube.com/watch?v=...
     python shazam.py download https://soundcloud.com/... --debug
+    python shazam.py download https://www.youtube.com/watch?v=... https://soundcloud.com/...
     python shazam.py recognize path/to/audio.mp3
     python shazam.py recognize https://soundcloud.com/...
     """)
@@ -418,7 +728,7 @@ Examples:
 def main() -> None:
     parser = argparse.ArgumentParser(description='Shazam Tool')
     parser.add_argument('command', nargs='?', help='scan, download, or recognize')
-    parser.add_argument('url_or_file', nargs='?', help='URL or file path')
+    parser.add_argument('url_or_file', nargs='*', help='URL(s) or file path')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
 
     args = parser.parse_args()
@@ -427,10 +737,14 @@ def main() -> None:
         print_usage()
         sys.exit(1)
 
+    # Only download takes several URLs; the other commands take at most one argument
+    if args.command != 'download' and len(args.url_or_file) > 1:
+        parser.error(f"unrecognized arguments: {' '.join(args.url_or_file[1:])}")
+
     setup_logging(args.debug)
 
     command = args.command
-    url_or_file = args.url_or_file
+    url_or_file = args.url_or_file[0] if args.url_or_file else None
 
     output_dir = "recognised-lists"
     ensure_directory_exists(output_dir)
@@ -440,14 +754,16 @@ def main() -> None:
 
     if command == 'download':
         if not url_or_file:
-            logger.error("Missing URL. Usage: python shazam.py download <url> [--debug]")
+            logger.error("Missing URL. Usage: python shazam.py download <url> [<url> ...] [--debug]")
             sys.exit(1)
 
-        title = download_from_url(url_or_file)
-        if title:
-            safe_title = re.sub(r'[^\w\s\-\(\)]', '', title).strip()
-            safe_title = re.sub(r'\s+', '_', safe_title)
-            output_filename = os.path.join(output_dir, f"{safe_title}.txt")
+        urls = args.url_or_file
+        for url in urls:
+            try:
+                validate_url(url)
+            except ValueError as e:
+                logger.error(f"Invalid URL: {e}")
+                sys.exit(1)
 
         try:
             with open(output_filename, "w", encoding="utf-8") as f:
@@ -456,19 +772,20 @@ def main() -> None:
             logger.error(f"Error creating output file {output_filename}: {e}")
             sys.exit(1)
 
-        # Process downloaded files
-        ensure_directory_exists(DOWNLOADS_DIR)
-        mp3_files = [f for f in os.listdir(DOWNLOADS_DIR) if f.endswith('.mp3')]
-        if not mp3_files:
+        titles, processed = asyncio.run(download_and_process(urls, output_filename))
+        if not processed:
             logger.warning(f"No MP3 files found in '{DOWNLOADS_DIR}' directory.")
             return
 
-        total_files = len(mp3_files)
-        logger.info(f"Found {total_files} MP3 file(s) to process...")
-
-        for idx, file_name in enumerate(mp3_files, start=1):
-            full_path = os.path.join(DOWNLOADS_DIR, file_name)
-            process_audio_file(full_path, output_filename, idx, total_files)
+        # A single download names the results file after its title
+        title = titles[0] if len(titles) == 1 else None
+        if title:
+            titled_filename = os.path.join(output_dir, f"{sanitize_title(title)}.txt")
+            try:
+                os.replace(output_filename, titled_filename)
+                output_filename = titled_filename
+            except OSError as e:
+                logger.error(f"Error renaming output file to {titled_filename}: {e}")
 
         logger.info(f"\nAll files successfully processed!")
         logger.info(f"Results saved to {output_filename}")
@@ -495,16 +812,13 @@ def main() -> None:
                 sys.exit(1)
             title = download_from_url(audio_file)
             if title:
-                safe_title = re.sub(r'[^\w\s\-\(\)]', '', title).strip()
-                safe_title = re.sub(r'\s+', '_', safe_title)
-                output_filename = os.path.join(output_dir, f"{safe_title}.txt")
+                output_filename = os.path.join(output_dir, f"{sanitize_title(title)}.txt")
 
-            mp3_files = [f for f in os.listdir(DOWNLOADS_DIR) if f.endswith('.mp3')]
+            mp3_files = list_mp3_files(DOWNLOADS_DIR)
             if not mp3_files:
                 logger.error(f"No MP3 files found in '{DOWNLOADS_DIR}' directory after download.")
                 sys.exit(1)
-            latest_file = max([os.path.join(DOWNLOADS_DIR, f) for f in mp3_files],
-                              key=os.path.getmtime)
+            latest_file = max(mp3_files, key=lambda entry: entry.stat().st_mtime).path
 
             try:
                 with open(output_filename, "w", encoding="utf-8") as f:
@@ -513,7 +827,7 @@ def main() -> None:
                 logger.error(f"Error creating output file {output_filename}: {e}")
                 sys.exit(1)
 
-            process_audio_file(latest_file, output_filename, 1, 1)
+            process_audio_file(latest_file, output_filename)
             logger.info(f"\nResults saved to {output_filename}")
             return
 
@@ -529,7 +843,7 @@ def main() -> None:
             logger.error(f"Error creating output file {output_filename}: {e}")
             sys.exit(1)
 
-        process_audio_file(audio_file, output_filename, 1, 1)
+        process_audio_file(audio_file, output_filename)
         logger.info(f"\nResults saved to {output_filename}")
         return
 